@@ -1,7 +1,7 @@
 # Command line interface for the `py2deb' program.
 #
 # Author: Peter Odding <peter.odding@paylogic.com>
-# Last Change: May 22, 2017
+# Last Change: October 16, 2026
 # URL: https://py2deb.readthedocs.io
 
 """
@@ -99,6 +99,14 @@ Supported options:
 
     Can also be set using the environment variable $PY2DEB_CALLBACK.
 
+  --concurrency=COUNT
+
+    Convert up to COUNT packages in parallel. Defaults to 1 (packages are
+    converted one at a time). When combined with --python-callback the
+    callback needs to be thread safe.
+
+    Can also be set using the environment variable $PY2DEB_CONCURRENCY.
+
   --report-dependencies=FILENAME
 
     Add the Debian relationships needed to depend on the converted
@@ -133,64 +141,87 @@ import coloredlogs
 from deb_pkg_tools.control import patch_control_file
 from humanfriendly.terminal import usage, warning
 
-# Modules included in our package.
-from py2deb.converter import PackageConverter
-
 # Initialize a logger.
 logger = logging.getLogger(__name__)
 
+SHORT_OPTIONS = 'c:r:yvh'
+"""The short command line options of ``py2deb`` (a string in the format expected by :func:`getopt.getopt()`)."""
+
+LONG_OPTIONS = (
+    'config=', 'repository=', 'use-system-package=', 'name-prefix=',
+    'no-name-prefix=', 'rename=', 'install-prefix=',
+    'install-alternative=', 'python-callback=', 'concurrency=',
+    'report-dependencies=', 'yes', 'verbose', 'help',
+)
+"""
+The long command line options of ``py2deb`` (a tuple of strings).
+
+The format of the strings is the same as expected by :func:`getopt.getopt()`.
+"""
+
+OPTION_HANDLERS = {
+    '-c': lambda converter, value: converter.load_configuration_file(value),
+    '--config': lambda converter, value: converter.load_configuration_file(value),
+    '-r': lambda converter, value: converter.set_repository(value),
+    '--repository': lambda converter, value: converter.set_repository(value),
+    '--use-system-package': lambda converter, value: converter.use_system_package(*parse_pair(value)),
+    '--name-prefix': lambda converter, value: converter.set_name_prefix(value),
+    '--no-name-prefix': lambda converter, value: converter.rename_package(value, value),
+    '--rename': lambda converter, value: converter.rename_package(*parse_pair(value)),
+    '--install-prefix': lambda converter, value: converter.set_install_prefix(value),
+    '--install-alternative': lambda converter, value: converter.install_alternative(*parse_pair(value)),
+    '--python-callback': lambda converter, value: converter.set_python_callback(value),
+    '--concurrency': lambda converter, value: converter.set_concurrency(value),
+    '-y': lambda converter, value: converter.set_auto_install(True),
+    '--yes': lambda converter, value: converter.set_auto_install(True),
+    '-v': lambda converter, value: coloredlogs.increase_verbosity(),
+    '--verbose': lambda converter, value: coloredlogs.increase_verbosity(),
+}
+"""
+Mapping of command line options to the functions that apply them (a dictionary).
+
+The keys are short and long command line options as reported by
+:func:`getopt.getopt()` and the values are callables that take two
+arguments: The :class:`.PackageConverter` object and the value of the
+command line option (a string). The options ``--report-dependencies``
+and ``--help`` influence the control flow of :func:`main()` and so
+are handled there.
+"""
+
 
 def main():
     """Command line interface for the ``py2deb`` program."""
+    # Parse the command line options before doing anything else, so that
+    # `py2deb --help' doesn't pay for configuring terminal output and
+    # initializing a package converter.
+    try:
+        options, arguments = getopt.getopt(sys.argv[1:], SHORT_OPTIONS, LONG_OPTIONS)
+    except getopt.GetoptError as e:
+        warning("Failed to parse command line arguments: %s", e)
+        sys.exit(1)
+    if any(option in ('-h', '--help') for option, value in options):
+        usage(__doc__)
+        return
     # Configure terminal output.
     coloredlogs.install()
+    # The py2deb.converter module is imported here instead of at the top level
+    # because it pulls in pip-accel, pip and deb-pkg-tools, which dominate the
+    # startup time of py2deb and aren't needed to import this module (which
+    # the readme does to render the usage message).
+    from py2deb.converter import PackageConverter
     try:
         # Initialize a package converter.
         converter = PackageConverter()
-        # Parse and validate the command line options.
-        options, arguments = getopt.getopt(sys.argv[1:], 'c:r:yvh', [
-            'config=', 'repository=', 'use-system-package=', 'name-prefix=',
-            'no-name-prefix=', 'rename=', 'install-prefix=',
-            'install-alternative=', 'python-callback=', 'report-dependencies=',
-            'yes', 'verbose', 'help',
-        ])
+        # Validate and apply the command line options.
         control_file_to_update = None
         for option, value in options:
-            if option in ('-c', '--config'):
-                converter.load_configuration_file(value)
-            elif option in ('-r', '--repository'):
-                converter.set_repository(value)
-            elif option == '--use-system-package':
-                python_package_name, _, debian_package_name = value.partition(',')
-                converter.use_system_package(python_package_name, debian_package_name)
-            elif option == '--name-prefix':
-                converter.set_name_prefix(value)
-            elif option == '--no-name-prefix':
-                converter.rename_package(value, value)
-            elif option == '--rename':
-                python_package_name, _, debian_package_name = value.partition(',')
-                converter.rename_package(python_package_name, debian_package_name)
-            elif option == '--install-prefix':
-                converter.set_install_prefix(value)
-            elif option == '--install-alternative':
-                link, _, path = value.partition(',')
-                converter.install_alternative(link, path)
-            elif option == '--python-callback':
-                converter.set_python_callback(value)
-            elif option == '--report-dependencies':
+            if option == '--report-dependencies':
                 control_file_to_update = value
                 if not os.path.isfile(control_file_to_update):
                     msg = "The given control file doesn't exist! (%s)"
                     raise Exception(msg % control_file_to_update)
-            elif option in ('-y', '--yes'):
-                converter.set_auto_install(True)
-            elif option in ('-v', '--verbose'):
-                coloredlogs.increase_verbosity()
-            elif option in ('-h', '--help'):
-                usage(__doc__)
-                return
             else:
-                assert False, "Unhandled option!"
+                OPTION_HANDLERS[option](converter, value)
     except Exception as e:
         warning("Failed to parse command line arguments: %s", e)
         sys.exit(1)
@@ -205,3 +236,15 @@ def main():
     except Exception:
         logger.exception("Caught an unhandled exception!")
         sys.exit(1)
+
+
+def parse_pair(value):
+    """
+    Parse a command line argument in the format ``FIRST,SECOND``.
+
+    :param value: The value of a command line option (a string).
+    :returns: A tuple with two strings (the second string is empty
+              when the value doesn't contain a comma).
+    """
+    first, _, second = value.partition(',')
+    return first, second
@@ -3,7 +3,7 @@
 # Authors:
 #  - Arjan Verwer
 #  - Peter Odding <peter.odding@paylogic.com>
-# Last Change: August 6, 2020
+# Last Change: October 16, 2026
 # URL: https://py2deb.readthedocs.io
 
 """
@@ -24,26 +24,36 @@ import os
 import re
 import shutil
 import tempfile
+import threading
+import time
+from multiprocessing.pool import ThreadPool
 
 # External dependencies.
-from property_manager import PropertyManager, cached_property, lazy_property, mutable_property, set_property
+from property_manager import (
+    PropertyManager,
+    cached_property,
+    clear_property,
+    lazy_property,
+    mutable_property,
+    set_property,
+)
 from deb_pkg_tools.cache import get_default_cache
 from deb_pkg_tools.checks import check_duplicate_files
-from deb_pkg_tools.utils import find_debian_architecture
 from humanfriendly import coerce_boolean
 from humanfriendly.text import compact
 from pip_accel import PipAccelerator
 from pip_accel.config import Config as PipAccelConfig
-from six.moves import configparser
 
 # Modules included in our package.
 from py2deb.utils import (
     PackageRepository,
     convert_package_name,
+    debian_architecture,
     default_name_prefix,
     normalize_package_name,
     normalize_package_version,
     package_names_match,
+    parse_configuration_file,
     tokenize_version,
 )
 from py2deb.package import PackageToConvert
@@ -51,6 +61,16 @@ from py2deb.package import PackageToConvert
 # Initialize a logger.
 logger = logging.getLogger(__name__)
 
+CONCURRENCY_TIMEOUT = 60 * 60 * 24 * 7
+"""
+The number of seconds to wait for each package converted in parallel (a number).
+
+:func:`PackageConverter.convert()` waits for the results of parallel package
+conversion with a timeout because on Python 2.7 waiting without a timeout
+can't be interrupted using Control-C. The timeout is one week, so in practice
+it never expires.
+"""
+
 MACHINE_ARCHITECTURE_MAPPING = dict(i686='i386', x86_64='amd64', armv6l='armhf')
 """
 Mapping of supported machine architectures (a dictionary).
@@ -87,6 +107,7 @@ class PackageConverter(PropertyManager):
         super(PackageConverter, self).__init__(**options)
         # Initialize our internal state.
         self.pip_accel = PipAccelerator(PipAccelConfig())
+        self.pip_accel_lock = threading.Lock()
         if load_configuration_files:
             self.load_default_configuration_files()
         if load_environment_variables:
@@ -105,6 +126,65 @@ class PackageConverter(PropertyManager):
         """
         return set()
 
+    @mutable_property
+    def concurrency(self):
+        """
+        The number of packages to convert in parallel (a positive integer, defaults to 1).
+
+        When this is greater than one, :func:`convert()` uses a pool of
+        threads to convert several packages at the same time. Because
+        :pypi:`pip-accel` isn't known to be thread safe (building a binary
+        distribution can run ``setup.py`` and, when :attr:`auto_install` is
+        enabled, install system packages) only one thread at a time builds and
+        installs a binary distribution. The remaining steps (stripping object
+        files, ``dpkg-shlibdeps``, ``dpkg-deb`` and Lintian_) run in parallel,
+        so this can considerably reduce the time it takes to convert a large
+        set of requirements. Because the :attr:`python_callback` may be called
+        from several threads at the same time, it needs to be thread safe when
+        this option is used.
+        """
+        return 1
+
+    @concurrency.setter
+    def concurrency(self, value):
+        """Automatically coerce :attr:`concurrency` to a positive integer."""
+        value = int(value)
+        if value < 1:
+            raise ValueError("Please provide a positive concurrency! (got %i)" % value)
+        set_property(self, 'concurrency', value)
+
+    @cached_property
+    def conversion_date(self):
+        """
+        The date and time at which packages are being converted (a string).
+
+        This is embedded in the description of every converted package (see
+        :attr:`.PackageToConvert.debian_description`). It's computed once per
+        call to :func:`convert()` (the first time a package description is
+        generated) so that all packages converted by the same call share the
+        same timestamp.
+        """
+        # The %e directive (not documented in the Python standard library but
+        # definitely available on Linux which is the only platform that py2deb
+        # targets, for obvious reasons :-) includes a leading space for single
+        # digit day-of-month numbers. I don't like that, fixed width fields are
+        # an artefact of 30 years ago and have no place in my software
+        # (generally speaking :-). This explains the split/join duo.
+        return ' '.join(time.strftime('%B %e, %Y at %H:%M').split())
+
+    @lazy_property
+    def converted_names(self):
+        """
+        Cache of package names generated by :func:`transform_name()` (a dictionary).
+
+        The keys are tuples with three values (the Python package name, the
+        name prefix and a tuple of extras) and the values are the resulting
+        Debian package names. Names taken from :attr:`system_packages` and
+        :attr:`name_mapping` aren't cached, so overrides added after a name
+        was cached still take effect.
+        """
+        return {}
+
     @cached_property
     def debian_architecture(self):
         """
@@ -112,9 +192,11 @@ class PackageConverter(PropertyManager):
 
         This logic was originally implemented in py2deb but has since been
         moved to :func:`deb_pkg_tools.utils.find_debian_architecture()`.
-        This property remains as a convenient shortcut.
+        This property remains as a convenient shortcut (the result is shared
+        by all converters in the current process, refer to
+        :func:`py2deb.utils.debian_architecture()`).
         """
-        return find_debian_architecture()
+        return debian_architecture()
 
     @mutable_property
     def install_prefix(self):
@@ -460,6 +542,18 @@ class PackageConverter(PropertyManager):
         """
         self.pip_accel.config.auto_install = coerce_boolean(enabled)
 
+    def set_concurrency(self, value):
+        """
+        Set the number of packages to convert in parallel.
+
+        :param value: A positive integer (or a string containing one).
+        :raises: :exc:`~exceptions.ValueError` when the value is not a
+                 positive integer.
+
+        Refer to :attr:`concurrency` for details.
+        """
+        self.concurrency = value
+
     def set_conversion_command(self, python_package_name, command):
         """
         Set shell command to be executed during conversion process.
@@ -584,6 +678,8 @@ class PackageConverter(PropertyManager):
         - ``$PY2DEB_INSTALL_PREFIX``
         - ``$PY2DEB_AUTO_INSTALL``
         - ``$PY2DEB_LINTIAN``
+        - ``$PY2DEB_CALLBACK``
+        - ``$PY2DEB_CONCURRENCY``
         """
         for variable, setter in (('PY2DEB_CONFIG', self.load_configuration_file),
                                  ('PY2DEB_REPOSITORY', self.set_repository),
@@ -591,17 +687,22 @@ class PackageConverter(PropertyManager):
                                  ('PY2DEB_INSTALL_PREFIX', self.set_install_prefix),
                                  ('PY2DEB_AUTO_INSTALL', self.set_auto_install),
                                  ('PY2DEB_LINTIAN', self.set_lintian_enabled),
-                                 ('PY2DEB_CALLBACK', self.set_python_callback)):
+                                 ('PY2DEB_CALLBACK', self.set_python_callback),
+                                 ('PY2DEB_CONCURRENCY', self.set_concurrency)):
             value = os.environ.get(variable)
             if value is not None:
                 setter(value)
 
-    def load_configuration_file(self, configuration_file):
+    def load_configuration_file(self, configuration_file, missing_ok=False):
         """
         Load configuration defaults from a configuration file.
 
         :param configuration_file: The pathname of a configuration file (a
                                    string).
+        :param missing_ok: :data:`True` to silently ignore a configuration
+                           file that doesn't exist or isn't a regular file,
+                           :data:`False` to raise an exception instead (the
+                           default).
         :raises: :exc:`~exceptions.Exception` when the configuration file
                  cannot be loaded.
 
@@ -618,6 +719,7 @@ class PackageConverter(PropertyManager):
            install-prefix = /usr/lib/py2deb
            auto-install = on
            lintian = on
+           concurrency = 4
 
            # The `alternatives' section contains instructions
            # for Debian's `update-alternatives' system.
@@ -648,46 +750,34 @@ class PackageConverter(PropertyManager):
           (refer to :func:`set_conversion_command()` for details).
         """
         # Load the configuration file.
-        parser = configparser.RawConfigParser()
         configuration_file = os.path.expanduser(configuration_file)
         logger.debug("Loading configuration file: %s", configuration_file)
-        files_loaded = parser.read(configuration_file)
-        try:
-            assert len(files_loaded) == 1
-            assert os.path.samefile(configuration_file, files_loaded[0])
-        except Exception:
-            msg = "Failed to load configuration file! (%s)"
-            raise Exception(msg % configuration_file)
+        sections = parse_configuration_file(configuration_file, missing_ok=missing_ok)
         # Apply the global settings in the configuration file.
-        if parser.has_option('py2deb', 'repository'):
-            self.set_repository(parser.get('py2deb', 'repository'))
-        if parser.has_option('py2deb', 'name-prefix'):
-            self.set_name_prefix(parser.get('py2deb', 'name-prefix'))
-        if parser.has_option('py2deb', 'install-prefix'):
-            self.set_install_prefix(parser.get('py2deb', 'install-prefix'))
-        if parser.has_option('py2deb', 'auto-install'):
-            self.set_auto_install(parser.get('py2deb', 'auto-install'))
-        if parser.has_option('py2deb', 'lintian'):
-            self.set_lintian_enabled(parser.get('py2deb', 'lintian'))
-        if parser.has_option('py2deb', 'python-callback'):
-            self.set_python_callback(parser.get('py2deb', 'python-callback'))
+        global_options = sections.get('py2deb', {})
+        for option, setter in (('repository', self.set_repository),
+                               ('name-prefix', self.set_name_prefix),
+                               ('install-prefix', self.set_install_prefix),
+                               ('auto-install', self.set_auto_install),
+                               ('lintian', self.set_lintian_enabled),
+                               ('python-callback', self.set_python_callback),
+                               ('concurrency', self.set_concurrency)):
+            if option in global_options:
+                setter(global_options[option])
         # Apply the defined alternatives.
-        if parser.has_section('alternatives'):
-            for link, path in parser.items('alternatives'):
-                self.install_alternative(link, path)
+        for link, path in sections.get('alternatives', {}).items():
+            self.install_alternative(link, path)
         # Apply any package specific settings.
-        for section in parser.sections():
+        for section, options in sections.items():
             tag, _, package = section.partition(':')
             if tag == 'package':
-                if parser.has_option(section, 'no-name-prefix'):
-                    if parser.getboolean(section, 'no-name-prefix'):
+                if 'no-name-prefix' in options:
+                    if coerce_boolean(options['no-name-prefix']):
                         self.rename_package(package, package)
-                if parser.has_option(section, 'rename'):
-                    rename_to = parser.get(section, 'rename')
-                    self.rename_package(package, rename_to)
-                if parser.has_option(section, 'script'):
-                    script = parser.get(section, 'script')
-                    self.set_conversion_command(package, script)
+                if 'rename' in options:
+                    self.rename_package(package, options['rename'])
+                if 'script' in options:
+                    self.set_conversion_command(package, options['script'])
 
     def load_default_configuration_files(self):
         """
@@ -698,12 +788,13 @@ class PackageConverter(PropertyManager):
         - ``/etc/py2deb.ini``
         - ``~/.py2deb.ini``
 
+        Locations that don't exist or aren't regular files are skipped.
+
         :raises: :exc:`~exceptions.Exception` when a configuration file
                  exists but cannot be loaded.
         """
         for location in ('/etc/py2deb.ini', os.path.expanduser('~/.py2deb.ini')):
-            if os.path.isfile(location):
-                self.load_configuration_file(location)
+            self.load_configuration_file(location, missing_ok=True)
 
     def convert(self, pip_install_arguments):
         """
@@ -734,34 +825,43 @@ class PackageConverter(PropertyManager):
         ['python-py2deb (=0.18)']
 
         """
+        # Make sure packages converted by this call don't reuse the timestamp
+        # of a previous call (when a converter is used more than once).
+        clear_property(self, 'conversion_date')
         try:
-            generated_archives = []
-            dependencies_to_report = []
+            dependencies_to_report = set()
             # Download and unpack the requirement set and store the complete
             # set as an instance variable because transform_version() will need
             # it later on.
             self.packages_to_convert = list(self.get_source_distributions(pip_install_arguments))
-            # Convert packages that haven't been converted already.
             for package in self.packages_to_convert:
                 # If the requirement is a 'direct' (non-transitive) requirement
                 # it means the caller explicitly asked for this package to be
                 # converted, so we add it to the list of converted dependencies
                 # that we report to the caller once we've finished converting.
                 if package.requirement.is_direct:
-                    dependencies_to_report.append('%s (= %s)' % (package.debian_name, package.debian_version))
-                if package.existing_archive:
-                    # If the same version of this package was converted in a
-                    # previous run we can save a lot of time by skipping it.
-                    logger.info("Package %s (%s) already converted: %s",
-                                package.python_name, package.python_version,
-                                package.existing_archive.filename)
-                    generated_archives.append(package.existing_archive)
+                    dependencies_to_report.add('%s (= %s)' % (package.debian_name, package.debian_version))
+            # Convert packages that haven't been converted already.
+            if self.concurrency > 1 and len(self.packages_to_convert) > 1:
+                pool = ThreadPool(min(self.concurrency, len(self.packages_to_convert)))
+                try:
+                    # We use imap() and wait for each result with a timeout
+                    # instead of using map() because on Python 2.7 the latter
+                    # ignores Control-C and because map() only reports a
+                    # failed conversion after all packages have been processed.
+                    results = pool.imap(self.convert_package, self.packages_to_convert)
+                    generated_archives = [results.next(CONCURRENCY_TIMEOUT) for package in self.packages_to_convert]
+                except BaseException:
+                    # Don't start converting the remaining packages when
+                    # one of the conversions failed (or was interrupted).
+                    pool.terminate()
+                    raise
                 else:
-                    archive = package.convert()
-                    if not os.path.samefile(os.path.dirname(archive), self.repository.directory):
-                        shutil.move(archive, self.repository.directory)
-                        archive = os.path.join(self.repository.directory, os.path.basename(archive))
-                    generated_archives.append(archive)
+                    pool.close()
+                finally:
+                    pool.join()
+            else:
+                generated_archives = [self.convert_package(p) for p in self.packages_to_convert]
             # Use deb-pkg-tools to sanity check the generated package archives
             # for duplicate files. This should never occur but unfortunately
             # can happen because Python's packaging infrastructure is a lot
@@ -776,6 +876,32 @@ class PackageConverter(PropertyManager):
             # Always clean up temporary directories created by pip and pip-accel.
             self.pip_accel.cleanup_temporary_directories()
 
+    def convert_package(self, package):
+        """
+        Convert a single Python package to a Debian package.
+
+        :param package: A :class:`.PackageToConvert` object.
+        :returns: The pathname of the Debian package archive in
+                  :attr:`repository` (a string).
+
+        If the same version of the package was converted in a previous run the
+        existing archive is reused. This method is called by :func:`convert()`,
+        possibly from several threads at the same time (see
+        :attr:`concurrency`).
+        """
+        if package.existing_archive:
+            # If the same version of this package was converted in a
+            # previous run we can save a lot of time by skipping it.
+            logger.info("Package %s (%s) already converted: %s",
+                        package.python_name, package.python_version,
+                        package.existing_archive.filename)
+            return package.existing_archive.filename
+        archive = package.convert()
+        if not os.path.samefile(os.path.dirname(archive), self.repository.directory):
+            shutil.move(archive, self.repository.directory)
+            archive = os.path.join(self.repository.directory, os.path.basename(archive))
+        return archive
+
     def get_source_distributions(self, pip_install_arguments):
         """
         Use :pypi:`pip-accel` to download and unpack Python source distributions.
@@ -839,15 +965,22 @@ class PackageConverter(PropertyManager):
             return debian_package_name
         # Check for a package rename override by the caller.
         debian_package_name = self.name_mapping.get(key)
+        if debian_package_name:
+            # Always normalize the package name (even if it was given to us by the caller).
+            return normalize_package_name(debian_package_name)
+        # No override. Make something up :-). The same names are transformed
+        # over and over again (once for every package that depends on them)
+        # so we cache the result of the name conversion algorithm.
+        cache_key = (python_package_name, self.name_prefix, extras)
+        debian_package_name = self.converted_names.get(cache_key)
         if not debian_package_name:
-            # No override. Make something up :-).
-            debian_package_name = convert_package_name(
+            debian_package_name = normalize_package_name(convert_package_name(
                 python_package_name=python_package_name,
                 name_prefix=self.name_prefix,
                 extras=extras,
-            )
-        # Always normalize the package name (even if it was given to us by the caller).
-        return normalize_package_name(debian_package_name)
+            ))
+            self.converted_names[cache_key] = debian_package_name
+        return debian_package_name
 
     def transform_version(self, package_to_convert, python_requirement_name, python_requirement_version):
         """
@@ -3,7 +3,7 @@
 # Authors:
 #  - Arjan Verwer
 #  - Peter Odding <peter.odding@paylogic.com>
-# Last Change: August 6, 2020
+# Last Change: October 16, 2026
 # URL: https://py2deb.readthedocs.io
 
 """
@@ -18,19 +18,19 @@ conversion logic.
 """
 
 # Standard library modules.
+import fnmatch
 import glob
 import logging
 import os
 import platform
 import re
 import sys
-import time
 
 # External dependencies.
 from deb_pkg_tools.control import merge_control_fields, unparse_control_fields
-from deb_pkg_tools.package import build_package, find_object_files, find_system_dependencies, strip_object_files
+from deb_pkg_tools.package import build_package, find_object_files, find_system_dependencies
 from executor import execute
-from humanfriendly.text import concatenate, pluralize
+from humanfriendly.text import concatenate
 from pkg_resources import Requirement
 from pkginfo import UnpackedSDist
 from property_manager import PropertyManager, cached_property
@@ -46,6 +46,7 @@ from py2deb.utils import (
     normalize_package_version,
     package_names_match,
     python_version,
+    strip_object_files,
 )
 
 # Initialize a logger.
@@ -56,6 +57,24 @@ logger = logging.getLogger(__name__)
 # variable $PATH).
 KNOWN_INSTALL_PREFIXES = ('/usr', '/usr/local')
 
+# The following compiled regular expressions are used by transform_binary_dist()
+# to rewrite the pathnames of the files in binary distributions.
+PYPY_SITE_PACKAGES_PATTERN = re.compile('^(dist|site)-packages/')
+PYPY_VERSION_SEGMENT_PATTERN = re.compile(r'/pypy\d(\.\d)?/')
+SITE_PACKAGES_PATTERN = re.compile(r'lib/(python|pypy)\d+(\.\d+)*/(dist|site)-packages/')
+
+# The following templates are used to convert Python version specifiers to
+# Debian package relationships. Debian doesn't have a "not equal" relationship
+# so `!=' is expressed as a choice between "less than" and "greater than".
+DEPENDENCY_TEMPLATES = {
+    '==': '%(name)s (= %(version)s)',
+    '!=': '%(name)s (<< %(version)s) | %(name)s (>> %(version)s)',
+    '<': '%(name)s (<< %(version)s)',
+    '>': '%(name)s (>> %(version)s)',
+    '<=': '%(name)s (<= %(version)s)',
+    '>=': '%(name)s (>= %(version)s)',
+}
+
 
 class PackageToConvert(PropertyManager):
 
@@ -109,17 +128,9 @@ class PackageToConvert(PropertyManager):
                         # back to a dependency without a version specification
                         # so we don't drop the dependency.
                         dependencies.add(debian_package_name)
-                    elif constraint == '==':
-                        dependencies.add('%s (= %s)' % (debian_package_name, version))
-                    elif constraint == '!=':
-                        values = (debian_package_name, version, debian_package_name, version)
-                        dependencies.add('%s (<< %s) | %s (>> %s)' % values)
-                    elif constraint == '<':
-                        dependencies.add('%s (<< %s)' % (debian_package_name, version))
-                    elif constraint == '>':
-                        dependencies.add('%s (>> %s)' % (debian_package_name, version))
-                    elif constraint in ('<=', '>='):
-                        dependencies.add('%s (%s %s)' % (debian_package_name, constraint, version))
+                    elif constraint in DEPENDENCY_TEMPLATES:
+                        template = DEPENDENCY_TEMPLATES[constraint]
+                        dependencies.add(template % dict(name=debian_package_name, version=version))
                     else:
                         msg = "Conversion specifier not supported! (%r used by Python package %s)"
                         raise Exception(msg % (constraint, self.python_name))
@@ -135,17 +146,9 @@ class PackageToConvert(PropertyManager):
         Get a minimal description for the converted Debian package.
 
         Includes the name of the Python package and the date at which the
-        package was converted.
-        """
-        text = ["Python package", self.python_name, "converted by py2deb on"]
-        # The %e directive (not documented in the Python standard library but
-        # definitely available on Linux which is the only platform that py2deb
-        # targets, for obvious reasons :-) includes a leading space for single
-        # digit day-of-month numbers. I don't like that, fixed width fields are
-        # an artefact of 30 years ago and have no place in my software
-        # (generally speaking :-). This explains the split/compact duo.
-        text.extend(time.strftime('%B %e, %Y at %H:%M').split())
-        return ' '.join(text)
+        package was converted (see :attr:`.PackageConverter.conversion_date`).
+        """
+        return ' '.join(["Python package", self.python_name, "converted by py2deb on", self.converter.conversion_date])
 
     @cached_property
     def debian_maintainer(self):
@@ -171,8 +174,8 @@ class PackageToConvert(PropertyManager):
 
         .. _#25: https://github.com/paylogic/py2deb/pull/25
         """
-        if "DEBFULLNAME" in os.environ:
-            maintainer = os.environ["DEBFULLNAME"]
+        maintainer = os.environ.get("DEBFULLNAME")
+        if maintainer is not None:
             maintainer_email = os.environ.get("DEBEMAIL")
         elif self.metadata.maintainer:
             maintainer = self.metadata.maintainer
@@ -224,6 +227,36 @@ class PackageToConvert(PropertyManager):
             self.python_version, prerelease_workaround=self.converter.prerelease_workaround
         )
 
+    @cached_property
+    def egg_info_directory(self):
+        """
+        Find the ``*.egg-info`` directory in the unpacked source distribution.
+
+        :returns: The pathname of the ``*.egg-info`` directory created by
+                  :pypi:`pip` (a string) or :data:`None` when no such
+                  directory exists.
+        :raises: :exc:`~exceptions.Exception` when the source distribution
+                 directory contains multiple ``*.egg-info`` directories.
+        """
+        pattern = os.path.join(self.requirement.source_directory, 'pip-egg-info', '*.egg-info')
+        matches = glob.glob(pattern)
+        if len(matches) > 1:
+            msg = "Source distribution directory of %s (%s) contains multiple *.egg-info directories: %s"
+            raise Exception(msg % (self.requirement.project_name, self.requirement.version, concatenate(matches)))
+        return matches[0] if matches else None
+
+    @cached_property
+    def egg_info_files(self):
+        """
+        The names of the files in :attr:`egg_info_directory` (a sorted list of strings).
+
+        The directory is listed once so that :func:`find_egg_info_file()`
+        (which is used by :attr:`metadata`, :attr:`python_requirements` and
+        :attr:`setuptools_namespaces`) doesn't have to search the file
+        system again for every metadata file.
+        """
+        return sorted(os.listdir(self.egg_info_directory)) if self.egg_info_directory else []
+
     @cached_property
     def existing_archive(self):
         """
@@ -256,6 +289,19 @@ class PackageToConvert(PropertyManager):
         """
         return self.converter.install_prefix not in KNOWN_INSTALL_PREFIXES
 
+    @cached_property
+    def hooks_script(self):
+        """
+        The source code of the :mod:`py2deb.hooks` module (a string).
+
+        This is read once per package and shared between the post-installation
+        and pre-removal maintainer scripts generated by
+        :func:`generate_maintainer_script()`.
+        """
+        py2deb_directory = os.path.dirname(os.path.abspath(__file__))
+        with open(os.path.join(py2deb_directory, 'hooks.py')) as handle:
+            return handle.read()
+
     @cached_property
     def metadata(self):
         """
@@ -492,12 +538,16 @@ class PackageToConvert(PropertyManager):
 
             # Unpack the binary distribution archive provided by pip-accel inside our build directory.
             build_install_prefix = os.path.join(build_directory, self.converter.install_prefix.lstrip('/'))
-            self.converter.pip_accel.bdists.install_binary_dist(
-                members=self.transform_binary_dist(python_executable),
-                prefix=build_install_prefix,
-                python=python_executable,
-                virtualenv_compatible=False,
-            )
+            # pip-accel isn't known to be thread safe, so when packages are
+            # converted in parallel only one thread at a time gets to build
+            # and install a binary distribution.
+            with self.converter.pip_accel_lock:
+                self.converter.pip_accel.bdists.install_binary_dist(
+                    members=self.transform_binary_dist(python_executable),
+                    prefix=build_install_prefix,
+                    python=python_executable,
+                    virtualenv_compatible=False,
+                )
 
             # Determine the directory (at build time) where the *.py files for
             # Python modules are located (the site-packages equivalent).
@@ -523,7 +573,8 @@ class PackageToConvert(PropertyManager):
             # Determine the package's dependencies, starting with the currently
             # running version of Python and the Python requirements converted
             # to Debian packages.
-            dependencies = [python_version()] + self.debian_dependencies
+            dependencies = [python_version()]
+            dependencies.extend(self.debian_dependencies)
 
             # Check if the converted package contains any compiled *.so files.
             object_files = find_object_files(build_directory)
@@ -532,7 +583,7 @@ class PackageToConvert(PropertyManager):
                 strip_object_files(object_files)
                 # Determine system dependencies by analyzing the linkage of the
                 # *.so file(s) found in the converted package.
-                dependencies += find_system_dependencies(object_files)
+                dependencies.extend(find_system_dependencies(object_files))
 
             # Make up some control file fields ... :-)
             architecture = self.determine_package_architecture(object_files)
@@ -577,8 +628,8 @@ class PackageToConvert(PropertyManager):
                 overrides_file = os.path.join(overrides_directory, self.debian_name)
                 os.makedirs(overrides_directory)
                 with open(overrides_file, 'w') as handle:
-                    for tag in self.converter.lintian_ignore:
-                        handle.write('%s: %s\n' % (self.debian_name, tag))
+                    handle.write(''.join('%s: %s\n' % (self.debian_name, tag)
+                                         for tag in self.converter.lintian_ignore))
 
             # Find the alternatives relevant to the package we're building.
             alternatives = set((link, path) for link, path in self.converter.alternatives
@@ -656,21 +707,30 @@ class PackageToConvert(PropertyManager):
         """
         Find :pypi:`pip` metadata files in unpacked source distributions.
 
-        :param pattern: The :mod:`glob` pattern to search for (a string).
-        :returns: A list of matched filenames (strings).
+        :param pattern: The :mod:`fnmatch` pattern to search for (a string).
+                        When this is empty the pathname of the
+                        ``*.egg-info`` directory is returned.
+        :returns: The pathname of the matched file (a string) or
+                  :data:`None` when no file matched.
 
         When pip unpacks a source distribution archive it creates a directory
         ``pip-egg-info`` which contains the package metadata in a declarative
-        and easy to parse format. This method finds such metadata files.
-        """
-        full_pattern = os.path.join(self.requirement.source_directory, 'pip-egg-info', '*.egg-info', pattern)
-        logger.debug("Looking for %r file(s) using pattern %r ..", pattern, full_pattern)
-        matches = glob.glob(full_pattern)
+        and easy to parse format. This method finds such metadata files
+        using :attr:`egg_info_directory` and :attr:`egg_info_files`.
+        """
+        logger.debug("Looking for %r file(s) in %s ..", pattern, self.egg_info_directory)
+        if not self.egg_info_directory:
+            matches = []
+        elif pattern:
+            matches = [os.path.join(self.egg_info_directory, fn) for fn in fnmatch.filter(self.egg_info_files, pattern)]
+        else:
+            matches = [os.path.join(self.egg_info_directory, '')]
         if len(matches) > 1:
-            msg = "Source distribution directory of %s (%s) contains multiple *.egg-info directories: %s"
-            raise Exception(msg % (self.requirement.project_name, self.requirement.version, concatenate(matches)))
+            msg = "Metadata directory of %s (%s) contains multiple files matching %r: %s"
+            raise Exception(msg % (self.requirement.project_name, self.requirement.version,
+                                   pattern, concatenate(matches)))
         elif matches:
-            logger.debug("Matched %s: %s.", pluralize(len(matches), "file", "files"), concatenate(matches))
+            logger.debug("Matched file: %s.", matches[0])
             return matches[0]
         else:
             logger.debug("No matching %r files found.", pattern)
@@ -699,23 +759,14 @@ class PackageToConvert(PropertyManager):
             are serialized to text using :func:`repr()` and embedded inside the
             generated maintainer script.
         """
-        # Read the py2deb/hooks.py script.
-        py2deb_directory = os.path.dirname(os.path.abspath(__file__))
-        hooks_script = os.path.join(py2deb_directory, 'hooks.py')
-        with open(hooks_script) as handle:
-            contents = handle.read()
-        blocks = contents.split('\n\n')
-        # Generate the shebang / hashbang line.
-        blocks.insert(0, '#!%s' % python_executable)
         # Generate the call to the top level function.
         encoded_arguments = ', '.join('%s=%r' % (k, v) for k, v in arguments.items())
-        blocks.append('%s(%s)' % (function, encoded_arguments))
-        # Write the maintainer script.
+        # Write the maintainer script: The shebang / hashbang line, the
+        # contents of py2deb/hooks.py and the call to the top level function.
         with open(filename, 'w') as handle:
-            handle.write('\n\n'.join(blocks))
-            handle.write('\n')
-        # Make sure the maintainer script is executable.
-        os.chmod(filename, 0o755)
+            handle.write('#!%s\n\n%s\n\n%s(%s)\n' % (python_executable, self.hooks_script, function, encoded_arguments))
+            # Make sure the maintainer script is executable.
+            os.fchmod(handle.fileno(), 0o755)
 
     def load_control_field_overrides(self, control_fields):
         """
@@ -735,10 +786,12 @@ class PackageToConvert(PropertyManager):
         distribution and if found it merges the overrides into the control
         fields that will be embedded in the generated Debian binary package.
 
-        This method first applies any overrides defined in the ``DEFAULT``
-        section and then it applies any overrides defined in the section whose
+        This method applies the overrides defined in the section whose
         normalized name (see :func:`~py2deb.utils.package_names_match()`)
-        matches that of the Python package.
+        matches that of the Python package. Any overrides defined in the
+        ``DEFAULT`` section are merged into every section (the options in the
+        matching section take precedence), so they only apply to packages
+        that have a matching section.
         """
         py2deb_cfg = os.path.join(self.requirement.source_directory, 'stdeb.cfg')
         if not os.path.isfile(py2deb_cfg):
@@ -747,20 +800,16 @@ class PackageToConvert(PropertyManager):
             logger.debug("Loading control field overrides from %s ..", py2deb_cfg)
             parser = configparser.RawConfigParser()
             parser.read(py2deb_cfg)
-            # Prepare to load the overrides from the DEFAULT section and
-            # the section whose name matches that of the Python package.
-            # DEFAULT is processed first on purpose.
-            section_names = ['DEFAULT']
-            # Match the normalized package name instead of the raw package
-            # name because `python setup.py egg_info' normalizes
-            # underscores in package names to dashes which can bite
-            # unsuspecting users. For what it's worth, PEP-8 discourages
-            # underscores in package names but doesn't forbid them:
+            # Load the overrides from the section whose name matches that of
+            # the Python package (the options in the DEFAULT section are
+            # included in every section). Match the normalized package name
+            # instead of the raw package name because `python setup.py
+            # egg_info' normalizes underscores in package names to dashes
+            # which can bite unsuspecting users. For what it's worth, PEP-8
+            # discourages underscores in package names but doesn't forbid them:
             # https://www.python.org/dev/peps/pep-0008/#package-and-module-names
-            section_names.extend(section_name for section_name in parser.sections()
-                                 if package_names_match(section_name, self.python_name))
-            for section_name in section_names:
-                if parser.has_section(section_name):
+            for section_name in parser.sections():
+                if package_names_match(section_name, self.python_name):
                     overrides = dict(parser.items(section_name))
                     logger.debug("Found %i control file field override(s) in section %s of %s: %r",
                                  len(overrides), section_name, py2deb_cfg, overrides)
@@ -822,26 +871,32 @@ class PackageToConvert(PropertyManager):
                 # In this if branch we change 2 to look like 1 so that the
                 # following if/else branches don't need to care about the
                 # difference.
-                member.name = re.sub('^(dist|site)-packages/', normalized_pypy_path, member.name)
+                member.name = PYPY_SITE_PACKAGES_PATTERN.sub(normalized_pypy_path, member.name)
             if self.has_custom_install_prefix:
                 # Strip the complete /usr/lib/pythonX.Y/site-packages/ prefix
-                # so we can replace it with the custom installation prefix.
-                member.name = re.sub(r'lib/(python|pypy)\d+(\.\d+)*/(dist|site)-packages/', 'lib/', member.name)
+                # so we can replace it with the custom installation prefix
+                # (the substring test avoids running the regular expression
+                # on members that can't match, like executables and data).
+                if '-packages/' in member.name:
+                    member.name = SITE_PACKAGES_PATTERN.sub('lib/', member.name)
                 # Rewrite executable Python scripts so they know about the
-                # custom installation prefix.
+                # custom installation prefix and update the interpreter
+                # reference in the first line (in a single pass).
                 if is_executable:
-                    handle = embed_install_prefix(handle, os.path.join(self.converter.install_prefix, 'lib'))
+                    handle = embed_install_prefix(handle, os.path.join(self.converter.install_prefix, 'lib'),
+                                                  interpreter=interpreter)
             else:
                 if on_pypy:
                     # Normalize the PyPy "versioned directory segment" (it differs
                     # between virtual environments versus system wide installations).
-                    member.name = re.sub(r'/pypy\d(\.\d)?/', normalized_pypy_segment, member.name)
+                    member.name = PYPY_VERSION_SEGMENT_PATTERN.sub(normalized_pypy_segment, member.name)
                 # Rewrite /site-packages/ to /dist-packages/. For details see
                 # https://wiki.debian.org/Python#Deviations_from_upstream.
-                member.name = member.name.replace('/site-packages/', '/dist-packages/')
-            # Update the interpreter reference in the first line of executable scripts.
-            if is_executable:
-                handle = self.update_shebang(handle, interpreter)
+                if '/site-packages/' in member.name:
+                    member.name = member.name.replace('/site-packages/', '/dist-packages/')
+                # Update the interpreter reference in the first line of executable scripts.
+                if is_executable:
+                    handle = self.update_shebang(handle, interpreter)
             yield member, handle
 
     def update_shebang(self, handle, interpreter):
@@ -874,10 +929,10 @@ class PackageToConvert(PropertyManager):
         .. _shebang: https://en.wikipedia.org/wiki/Shebang_(Unix)
         """
         if detect_python_script(handle):
-            lines = handle.readlines()
-            lines[0] = b'#!' + interpreter.encode('ascii') + b'\n'
-            handle = BytesIO(b''.join(lines))
-            handle.seek(0)
+            # Skip the existing shebang and copy the remainder of the script
+            # as a single chunk (instead of splitting it into lines).
+            handle.readline()
+            handle = BytesIO(b'#!' + interpreter.encode('ascii') + b'\n' + handle.read())
         return handle
 
     def __str__(self):
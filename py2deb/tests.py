@@ -1,7 +1,7 @@
 # Automated tests for the `py2deb' package.
 #
 # Author: Peter Odding <peter.odding@paylogic.com>
-# Last Change: August 5, 2020
+# Last Change: October 16, 2026
 # URL: https://py2deb.readthedocs.io
 
 """
@@ -24,26 +24,32 @@ import logging
 import os
 import shutil
 import sys
+import sysconfig
 import tempfile
 
 # External dependencies.
 import coloredlogs
+import deb_pkg_tools.package
 from deb_pkg_tools.checks import DuplicateFilesFound
 from deb_pkg_tools.control import load_control_file, patch_control_file
 from deb_pkg_tools.package import inspect_package, parse_filename
 from executor import execute
 from humanfriendly.text import dedent
-from humanfriendly.testing import TestCase, run_cli, touch
+from humanfriendly.testing import PatchedAttribute, PatchedItem, TestCase, run_cli, touch
 
 # Modules included in our package.
+import py2deb.utils
 from py2deb.cli import main
 from py2deb.converter import PackageConverter
 from py2deb.utils import (
+    PackageRepository,
     TemporaryDirectory,
     convert_package_name,
     default_name_prefix,
     normalize_package_version,
+    parse_configuration_file,
     python_version,
+    strip_object_files,
 )
 from py2deb.hooks import (
     cleanup_bytecode_files,
@@ -143,6 +149,8 @@ class PackageConverterTestCase(TestCase):
         self.assertRaises(ValueError, converter.install_alternative, '', 'path')
         self.assertRaises(ValueError, converter.set_conversion_command, 'package-name', '')
         self.assertRaises(ValueError, converter.set_conversion_command, '', 'command')
+        self.assertRaises(ValueError, converter.set_concurrency, '0')
+        self.assertRaises(ValueError, converter.set_concurrency, 'many')
         exit_code, output = run_cli(main, '--unsupported-option')
         assert exit_code != 0
         exit_code, output = run_cli(main, '--report-dependencies', '/tmp/definitely-not-an-existing-control-file')
@@ -172,6 +180,85 @@ class PackageConverterTestCase(TestCase):
         assert normalize_package_version('1.0a2', prerelease_workaround=True) == '1.0~a2'
         assert normalize_package_version('1.0a2', prerelease_workaround=False) == '1.0a2'
 
+    def test_name_conversion(self):
+        """Test conversion of Python package names to Debian package names."""
+        assert convert_package_name('example', name_prefix='python') == 'python-example'
+        assert convert_package_name('MySQL_python', name_prefix='python') == 'python-mysql-python'
+        # Adjacent repeating words are compacted.
+        assert convert_package_name('python-debian', name_prefix='python') == 'python-debian'
+        assert convert_package_name('py2deb', name_prefix='py2deb') == 'py2deb'
+        assert convert_package_name('foo-foo-bar-bar', name_prefix='python') == 'python-foo-bar'
+        # Only complete words are compacted.
+        assert convert_package_name('pythonic', name_prefix='python') == 'python-pythonic'
+        assert convert_package_name('on-python', name_prefix='python') == 'python-on-python'
+        # Extras are encoded in the package name.
+        assert convert_package_name('raven', name_prefix='python', extras=['flask']) == 'python-raven-flask'
+
+    def test_package_repository(self):
+        """Make sure :class:`~py2deb.utils.PackageRepository` notices new archives and shares scans."""
+        with TemporaryDirectory() as directory:
+            touch(os.path.join(directory, 'python-foo_1.0_all.deb'))
+            # Pretend the directory was last modified a while ago, otherwise
+            # the result of scanning the directory won't be cached.
+            os.utime(directory, (0, 0))
+            repository = PackageRepository(directory=directory)
+            assert repository.get_package('python-foo', '1.0', 'all')
+            assert not repository.get_package('python-bar', '2.0', 'all')
+            # Other repository objects for the same directory share the scan.
+            assert PackageRepository(directory=directory).archives is repository.archives
+            # Archives added after the first lookup should be found.
+            touch(os.path.join(directory, 'python-bar_2.0_all.deb'))
+            assert repository.get_package('python-bar', '2.0', 'all')
+            assert len(repository.archives) == 2
+
+    def test_strip_object_files(self):
+        """Test batching and the one by one fallback of :func:`~py2deb.utils.strip_object_files()`."""
+        shared_objects = glob.glob(os.path.join(sysconfig.get_config_var('DESTSHARED') or '', '*.so'))
+        if not shared_objects:
+            return self.skipTest("no shared object files available to test with")
+        with TemporaryDirectory() as directory:
+            # Make sure the shared object can actually be made smaller (on
+            # Debian the shared objects of the system Python are stripped).
+            probe_file = os.path.join(directory, 'probe.so')
+            shutil.copy(shared_objects[0], probe_file)
+            execute('strip', '--strip-unneeded', probe_file)
+            original_size = os.path.getsize(shared_objects[0])
+            if os.path.getsize(probe_file) >= original_size:
+                return self.skipTest("shared object file %s can't be stripped any further" % shared_objects[0])
+            # A file that strip doesn't recognize makes a batched strip
+            # command fail, which should trigger the fallback.
+            bogus_file = os.path.join(directory, 'bogus.so')
+            with open(bogus_file, 'w') as handle:
+                handle.write('Not an object file.\n')
+            # Record the batches that are stripped one by one.
+            fallback_batches = []
+            fallback_function = deb_pkg_tools.package.strip_object_files
+
+            def spy(object_files):
+                fallback_batches.append(list(object_files))
+                return fallback_function(object_files)
+
+            with PatchedAttribute(deb_pkg_tools.package, 'strip_object_files', spy):
+                # When all files fit in a single batch the whole batch
+                # should be stripped one by one.
+                object_file = os.path.join(directory, 'first.so')
+                shutil.copy(shared_objects[0], object_file)
+                strip_object_files([object_file, bogus_file])
+                assert fallback_batches == [[object_file, bogus_file]]
+                assert os.path.getsize(object_file) < original_size
+                # When every file gets its own batch only the batch with the
+                # bogus file should be stripped one by one.
+                del fallback_batches[:]
+                object_file = os.path.join(directory, 'second.so')
+                shutil.copy(shared_objects[0], object_file)
+                with PatchedAttribute(py2deb.utils, 'STRIP_BATCH_SIZE', 1):
+                    strip_object_files([object_file, bogus_file])
+                assert fallback_batches == [[bogus_file]]
+                assert os.path.getsize(object_file) < original_size
+            # The bogus file should have been left alone.
+            with open(bogus_file) as handle:
+                assert handle.read() == 'Not an object file.\n'
+
     def test_conversion_of_simple_package(self):
         """
         Convert a simple Python package without any dependencies.
@@ -684,6 +771,99 @@ class PackageConverterTestCase(TestCase):
                 in_isolated_directory = filename.startswith('/usr/lib/pip-accel/')
                 assert is_directory or in_isolated_directory
 
+    def test_parallel_conversion(self):
+        """
+        Convert a group of packages in parallel.
+
+        Converts deb-pkg-tools_ and its dependencies sequentially, in parallel
+        using the ``--concurrency`` command line option and in parallel using
+        the ``$PY2DEB_CONCURRENCY`` environment variable and checks that the
+        same package archives and relationships are generated each time.
+
+        .. _deb-pkg-tools: https://pypi.org/project/deb-pkg-tools
+        """
+        results = []
+        for arguments, concurrency in (([], '1'),
+                                       (['--concurrency=2'], '1'),
+                                       ([], '2')):
+            with TemporaryDirectory() as directory:
+                # Prepare a control file to be patched.
+                control_file = os.path.join(directory, 'control')
+                with open(control_file, 'w') as handle:
+                    handle.write('Depends: vim\n')
+                # Run the conversion command.
+                command_line = ['--repository=%s' % directory, '--report-dependencies=%s' % control_file]
+                command_line.extend(arguments)
+                command_line.append('deb-pkg-tools==1.22')
+                with PatchedItem(os.environ, 'PY2DEB_CONCURRENCY', concurrency):
+                    exit_code, output = run_cli(main, *command_line)
+                assert exit_code == 0
+                # Collect the generated archives and reported relationships.
+                archives = sorted(os.path.basename(a) for a in glob.glob('%s/*.deb' % directory))
+                logger.debug("Found generated archive(s): %s", archives)
+                assert len(archives) > 1
+                control_fields = load_control_file(control_file)
+                results.append((archives, str(control_fields['Depends'])))
+        # Make sure parallel conversion gives the same results as sequential conversion.
+        assert results[0] == results[1] == results[2]
+
+    def test_configuration_file_caching(self):
+        """Make sure :func:`~py2deb.utils.parse_configuration_file()` notices changed and relocated files."""
+        with TemporaryDirectory() as directory:
+            configuration_file = os.path.join(directory, 'py2deb.ini')
+            with open(configuration_file, 'w') as handle:
+                handle.write('[py2deb]\nname-prefix = foo\n')
+            assert parse_configuration_file(configuration_file)['py2deb']['name-prefix'] == 'foo'
+            # Changes to the configuration file should be picked up.
+            with open(configuration_file, 'w') as handle:
+                handle.write('[py2deb]\nname-prefix = foobar\n')
+            assert parse_configuration_file(configuration_file)['py2deb']['name-prefix'] == 'foobar'
+            # Changes that don't update the last modified time (because they
+            # happen within the resolution of the file system's timestamps)
+            # should be picked up as well, as long as the size changes.
+            status = os.stat(configuration_file)
+            with open(configuration_file, 'w') as handle:
+                handle.write('[py2deb]\nname-prefix = foobarbaz\n')
+            os.utime(configuration_file, (status.st_atime, status.st_mtime))
+            assert parse_configuration_file(configuration_file)['py2deb']['name-prefix'] == 'foobarbaz'
+            # Relative pathnames should be resolved against the current
+            # working directory, even when another directory contains a
+            # configuration file with the same name (and size).
+            other_directory = os.path.join(directory, 'other')
+            os.mkdir(other_directory)
+            with open(os.path.join(other_directory, 'py2deb.ini'), 'w') as handle:
+                handle.write('[py2deb]\nname-prefix = barbaz\n')
+            working_directory = os.getcwd()
+            try:
+                os.chdir(directory)
+                assert parse_configuration_file('py2deb.ini')['py2deb']['name-prefix'] == 'foobarbaz'
+                os.chdir(other_directory)
+                assert parse_configuration_file('py2deb.ini')['py2deb']['name-prefix'] == 'barbaz'
+            finally:
+                os.chdir(working_directory)
+            # Edits that change neither the last modified time nor the size
+            # should be picked up as long as the file was modified less than
+            # two seconds before it was parsed.
+            with open(configuration_file, 'w') as handle:
+                handle.write('[py2deb]\nlintian = on\n')
+            status = os.stat(configuration_file)
+            assert parse_configuration_file(configuration_file)['py2deb']['lintian'] == 'on'
+            with open(configuration_file, 'w') as handle:
+                handle.write('[py2deb]\nlintian = no\n')
+            os.utime(configuration_file, (status.st_atime, status.st_mtime))
+            assert parse_configuration_file(configuration_file)['py2deb']['lintian'] == 'no'
+            # Once the file is old enough the parsed result should be reused.
+            os.utime(configuration_file, (0, 0))
+            sections = parse_configuration_file(configuration_file)
+            assert parse_configuration_file(configuration_file) is sections
+            # Missing configuration files should only be ignored on request.
+            missing_file = os.path.join(directory, 'missing.ini')
+            assert parse_configuration_file(missing_file, missing_ok=True) == {}
+            self.assertRaises(Exception, parse_configuration_file, missing_file)
+            # The same goes for pathnames that aren't regular files.
+            assert parse_configuration_file(directory, missing_ok=True) == {}
+            self.assertRaises(Exception, parse_configuration_file, directory)
+
     def test_python_callback_from_api(self):
         """Test Python callback logic (registered through the Python API)."""
         self.check_python_callback(python_callback_fn)
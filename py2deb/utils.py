@@ -3,32 +3,63 @@
 # Authors:
 #  - Arjan Verwer
 #  - Peter Odding <peter.odding@paylogic.com>
-# Last Change: August 6, 2020
+# Last Change: October 16, 2026
 # URL: https://py2deb.readthedocs.io
 
 """The :mod:`py2deb.utils` module contains miscellaneous code."""
 
 # Standard library modules.
+import collections
+import errno
 import logging
 import os
 import platform
 import re
 import shlex
 import shutil
+import stat
 import sys
 import tempfile
+import time
 
 # External dependencies.
-from property_manager import PropertyManager, cached_property, required_property
+import deb_pkg_tools.package
+from property_manager import PropertyManager, required_property
 from deb_pkg_tools.package import find_package_archives
+from deb_pkg_tools.utils import find_debian_architecture
+from executor import CommandNotFound, ExternalCommandFailed, execute
 from six import BytesIO
+from six.moves import configparser
 
 # Initialize a logger.
 logger = logging.getLogger(__name__)
 
+CONFIGURATION_CACHE = {}
+"""
+Cache of parsed configuration files (a dictionary).
+
+The keys are absolute pathnames of configuration files and the values are
+tuples with three values each: A tuple with the last modified time and size of
+the configuration file, the time when the configuration file was parsed and
+the parsed contents of the configuration file (in the format returned by
+:func:`parse_configuration_file()`).
+"""
+
+FUTURE_IMPORT_PATTERN = re.compile(br'^\s*from\s+__future__\s+import\s+')
+"""A compiled regular expression to match ``from __future__ import ...`` statements (a bytes pattern)."""
+
 integer_pattern = re.compile('([0-9]+)')
 """Compiled regular expression to match a consecutive run of digits."""
 
+INVALID_NAME_CHARACTERS_PATTERN = re.compile('[^a-z0-9]+')
+"""A compiled regular expression to match characters that aren't allowed in package names."""
+
+INVALID_VERSION_CHARACTERS_PATTERN = re.compile('[^a-z0-9.+]+')
+"""A compiled regular expression to match characters that aren't allowed in package versions."""
+
+PRERELEASE_PATTERN = re.compile(r'(\d)(a|b|rc)(\d)')
+"""A compiled regular expression to match the PEP 440 pre-release identifiers 'a', 'b' and 'rc'."""
+
 PYTHON_EXECUTABLE_PATTERN = re.compile(r'^(pypy|python)(\d(\.\d)?)?m?$')
 """
 A compiled regular expression to match Python interpreter executable names.
@@ -44,6 +75,44 @@ The following are examples of program names that match this pattern:
 - python3m
 """
 
+RELEASE_CANDIDATE_PATTERN = re.compile(r'(\d)c(\d)')
+"""A compiled regular expression to match the PEP 440 pre-release identifier 'c'."""
+
+REPEATING_WORDS_PATTERN = re.compile(r'(?<![^-])([a-z0-9]+)(?:-\1)+(?![^-])')
+"""
+A compiled regular expression to match adjacent repeating words in normalized package names.
+
+This is used by :func:`convert_package_name()` to do the same thing as
+:func:`compact_repeating_words()` in a single substitution.
+"""
+
+REPOSITORY_CACHE = {}
+"""
+Cache of package archives found in repository directories (a dictionary).
+
+The keys are absolute directory pathnames and the values are tuples with four
+values each: The last modified time of the directory, the time when the
+directory was scanned, a sorted list of package archives and a dictionary
+index of the package archives. Refer to :func:`scan_repository()` for details.
+"""
+
+RUNTIME_CACHE = {}
+"""
+Cache of values that can't change while py2deb is running (a dictionary).
+
+This is used by :func:`debian_architecture()` and :func:`python_version()`
+to avoid recomputing values that are specific to the current process or
+system.
+"""
+
+STRIP_BATCH_SIZE = 1024 * 64
+"""
+The maximum combined length of the pathnames given to one :man:`strip` command (an integer).
+
+This keeps :func:`strip_object_files()` well below the operating system's
+limit on the size of command line arguments (``ARG_MAX``).
+"""
+
 
 class PackageRepository(PropertyManager):
 
@@ -62,13 +131,16 @@ class PackageRepository(PropertyManager):
         """
         super(PackageRepository, self).__init__(directory=directory)
 
-    @cached_property
+    @property
     def archives(self):
         """
         A sorted list of package archives in :attr:`directory`.
 
         The value of :attr:`archives` is computed using
-        :func:`deb_pkg_tools.package.find_package_archives()`.
+        :func:`deb_pkg_tools.package.find_package_archives()` and cached by
+        :func:`scan_repository()`, so it's shared between
+        :class:`PackageRepository` objects for the same directory and it's
+        refreshed when archives are added to or removed from the directory.
 
         An example:
 
@@ -101,7 +173,7 @@ class PackageRepository(PropertyManager):
                      filename='/tmp/py2deb-six_1.6.1_all.deb')]
 
         """
-        return find_package_archives(self.directory)
+        return scan_repository(self.directory)[0]
 
     @required_property
     def directory(self):
@@ -123,9 +195,21 @@ class PackageRepository(PropertyManager):
         >>> repo.get_package('py2deb', '0.1', 'all')
         PackageFile(name='py2deb', version='0.1', architecture='all', filename='/tmp/py2deb_0.1_all.deb')
         """
-        for archive in self.archives:
-            if archive.name == package and archive.version == version and archive.architecture == architecture:
-                return archive
+        return self.index.get((package, str(version), architecture))
+
+    @property
+    def index(self):
+        """
+        A dictionary that enables constant time lookups of package archives.
+
+        The keys of the dictionary are tuples with three strings each (the
+        package name, version and architecture) and the values are
+        :class:`deb_pkg_tools.package.PackageFile` objects taken from
+        :attr:`archives`. This is used by :func:`get_package()` so that
+        looking up each converted package doesn't require a linear scan
+        of the repository. Refer to :func:`scan_repository()` for details.
+        """
+        return scan_repository(self.directory)[1]
 
 
 class TemporaryDirectory(object):
@@ -221,7 +305,7 @@ def convert_package_name(python_package_name, name_prefix=None, extras=()):
     # Normalize casing and special characters.
     debian_package_name = normalize_package_name(debian_package_name)
     # Compact repeating words (to avoid package names like 'python-python-debian').
-    debian_package_name = '-'.join(compact_repeating_words(debian_package_name.split('-')))
+    debian_package_name = REPEATING_WORDS_PATTERN.sub(r'\1', debian_package_name)
     # If a requirement includes extras this changes the dependencies of the
     # package. Because Debian doesn't have this concept we encode the names of
     # the extras in the name of the package.
@@ -232,6 +316,22 @@ def convert_package_name(python_package_name, name_prefix=None, extras=()):
     return debian_package_name
 
 
+def debian_architecture():
+    """
+    Find the Debian architecture of the current environment.
+
+    :returns: The Debian architecture (a string like ``i386``, ``amd64``, etc).
+
+    This calls :func:`deb_pkg_tools.utils.find_debian_architecture()` once
+    and caches the result in :data:`RUNTIME_CACHE`, because on architectures
+    other than ``i386``, ``amd64`` and ``armhf`` that function runs the
+    external command ``dpkg-architecture`` each time it's called.
+    """
+    if 'debian_architecture' not in RUNTIME_CACHE:
+        RUNTIME_CACHE['debian_architecture'] = find_debian_architecture()
+    return RUNTIME_CACHE['debian_architecture']
+
+
 def default_name_prefix():
     """
     Get the default package name prefix for the Python version we're running.
@@ -262,12 +362,16 @@ def detect_python_script(handle):
     return PYTHON_EXECUTABLE_PATTERN.match(program) is not None
 
 
-def embed_install_prefix(handle, install_prefix):
+def embed_install_prefix(handle, install_prefix, interpreter=None):
     """
     Embed Python snippet that adds custom installation prefix to module search path.
 
     :param handle: A file-like object containing an executable Python script.
     :param install_prefix: The pathname of the custom installation prefix (a string).
+    :param interpreter: If this is given (a string) the shebang of the script
+                        is changed to reference the given interpreter (this
+                        avoids a second pass over the script to update the
+                        shebang).
     :returns: A file-like object containing the modified Python script.
     """
     # Make sure the first line of the file contains something that looks like a
@@ -293,11 +397,15 @@ def embed_install_prefix(handle, install_prefix):
         while insertion_point < len(lines) and lines[insertion_point].startswith(b'#'):
             insertion_point += 1
         # The next step is to bump the insertion point if we find any `from
-        # __future__ import ...' statements.
+        # __future__ import ...' statements (the substring test avoids
+        # running the regular expression on most lines).
         for i, line in enumerate(lines):
-            if re.match(b'^\\s*from\\s+__future__\\s+import\\s+', line):
+            if b'__future__' in line and FUTURE_IMPORT_PATTERN.match(line):
                 insertion_point = i + 1
         lines.insert(insertion_point, ('import sys; sys.path.insert(0, %r)\n' % install_prefix).encode('UTF-8'))
+        # Update the interpreter reference in the first line.
+        if interpreter:
+            lines[0] = b'#!' + interpreter.encode('ascii') + b'\n'
         # Turn the modified contents back into a file-like object.
         handle = BytesIO(b''.join(lines))
     else:
@@ -361,7 +469,7 @@ def normalize_package_name(python_package_name):
     >>> normalize_package_name('simple_json')
     'simple-json'
     """
-    return re.sub('[^a-z0-9]+', '-', python_package_name.lower()).strip('-')
+    return INVALID_NAME_CHARACTERS_PATTERN.sub('-', python_package_name.lower()).strip('-')
 
 
 def normalize_package_version(python_package_version, prerelease_workaround=True):
@@ -393,12 +501,12 @@ def normalize_package_version(python_package_version, prerelease_workaround=True
     # "public version identifier".
     public_version, delimiter, local_version = python_package_version.partition('+')
     # Lowercase and remove invalid characters from the "public version identifier".
-    public_version = re.sub('[^a-z0-9.+]+', '-', public_version.lower()).strip('-')
+    public_version = INVALID_VERSION_CHARACTERS_PATTERN.sub('-', public_version.lower()).strip('-')
     if prerelease_workaround:
         # Translate the PEP 440 pre-release identifier 'c' to 'rc'.
-        public_version = re.sub(r'(\d)c(\d)', r'\1rc\2', public_version)
+        public_version = RELEASE_CANDIDATE_PATTERN.sub(r'\1rc\2', public_version)
         # Replicate the intended ordering of PEP 440 pre-release versions (a, b, rc).
-        public_version = re.sub(r'(\d)(a|b|rc)(\d)', r'\1~\2\3', public_version)
+        public_version = PRERELEASE_PATTERN.sub(r'\1~\2\3', public_version)
     # Restore the local version label (without any normalization).
     if local_version:
         public_version = public_version + '+' + local_version
@@ -407,7 +515,7 @@ def normalize_package_version(python_package_version, prerelease_workaround=True
     # they see an invalid Debian revision...
     if '-' in public_version:
         components = public_version.split('-')
-        if len(components) > 1 and not re.search('[0-9]', components[-1]):
+        if len(components) > 1 and not integer_pattern.search(components[-1]):
             components.append('1')
             public_version = '-'.join(components)
     return public_version
@@ -428,6 +536,74 @@ def package_names_match(a, b):
     return normalize_package_name(a) == normalize_package_name(b)
 
 
+def parse_configuration_file(filename, missing_ok=False):
+    """
+    Parse a configuration file (and cache the result).
+
+    :param filename: The pathname of the configuration file (a string).
+    :param missing_ok: :data:`True` to return an empty
+                       :class:`~collections.OrderedDict` when the
+                       configuration file doesn't exist or isn't a regular
+                       file, :data:`False` to raise an exception instead
+                       (the default).
+    :returns: A :class:`~collections.OrderedDict` that maps section names (in
+              the order they appear in the configuration file) to
+              dictionaries with the options of each section. As with
+              :meth:`~six.moves.configparser.RawConfigParser.items()` the
+              options of the ``DEFAULT`` section are included in every
+              section, but ``DEFAULT`` itself isn't included as a section.
+    :raises: :exc:`~exceptions.Exception` when the configuration file
+             cannot be loaded.
+
+    The result is cached in :data:`CONFIGURATION_CACHE` so that creating
+    several :class:`.PackageConverter` objects in a single process (which
+    loads the default configuration files each time) doesn't parse the same
+    configuration files over and over again. The cache is invalidated when the
+    last modified time or the size of the configuration file changes.
+    Nanosecond timestamps are used where available (they aren't on Python
+    2.7). Like :func:`scan_repository()` a result that was parsed less than
+    two seconds after the configuration file was last modified isn't
+    trusted, because changes within the same "tick" of a file system with
+    coarse timestamps don't necessarily change the size. The cache is keyed on the absolute pathname of the
+    configuration file, so relative pathnames are resolved against the
+    current working directory at the time of the call. Because the contents
+    are returned as plain dictionaries, callers can look up options without
+    going through :mod:`configparser`.
+
+    .. note:: The returned object is shared between callers and
+              should be considered read only.
+    """
+    msg = "Failed to load configuration file! (%s)"
+    pathname = os.path.abspath(filename)
+    # A single stat() call tells us whether the configuration file exists,
+    # whether it's a regular file and whether the cached result is stale.
+    try:
+        status = os.stat(pathname)
+    except OSError as e:
+        if missing_ok and e.errno == errno.ENOENT:
+            return collections.OrderedDict()
+        raise Exception(msg % filename)
+    if not stat.S_ISREG(status.st_mode):
+        if missing_ok:
+            return collections.OrderedDict()
+        raise Exception(msg % filename)
+    signature = (getattr(status, 'st_mtime_ns', status.st_mtime), status.st_size)
+    cached_value = CONFIGURATION_CACHE.get(pathname)
+    if cached_value and cached_value[0] == signature and cached_value[1] > status.st_mtime + 2:
+        logger.debug("Using cached configuration file: %s", filename)
+        return cached_value[2]
+    parsed_at = time.time()
+    parser = configparser.RawConfigParser()
+    # RawConfigParser.read() returns the list of filenames it successfully
+    # read, so comparing that list against the given filename is enough to
+    # know the file was loaded (no need to stat() the file again).
+    if parser.read(pathname) != [pathname]:
+        raise Exception(msg % filename)
+    sections = collections.OrderedDict((name, dict(parser.items(name))) for name in parser.sections())
+    CONFIGURATION_CACHE[pathname] = (signature, parsed_at, sections)
+    return sections
+
+
 def python_version():
     """
     Find the version of Python we're running.
@@ -438,15 +614,104 @@ def python_version():
 
     - The name of the Debian package providing the current Python version.
     - The name of the interpreter executable for the current Python version.
+
+    The result is cached in :data:`RUNTIME_CACHE` because this function is
+    called several times for every converted package.
     """
-    if platform.python_implementation() == 'PyPy':
-        python_version = 'pypy'
-        if sys.version_info[0] == 3:
-            python_version += '3'
-    else:
-        python_version = 'python%d.%d' % sys.version_info[:2]
-    logger.debug("Detected Python version: %s", python_version)
-    return python_version
+    if 'python_version' not in RUNTIME_CACHE:
+        if platform.python_implementation() == 'PyPy':
+            python_version = 'pypy'
+            if sys.version_info[0] == 3:
+                python_version += '3'
+        else:
+            python_version = 'python%d.%d' % sys.version_info[:2]
+        logger.debug("Detected Python version: %s", python_version)
+        RUNTIME_CACHE['python_version'] = python_version
+    return RUNTIME_CACHE['python_version']
+
+
+def scan_repository(directory):
+    """
+    Find the package archives in a repository directory (and cache the result).
+
+    :param directory: The pathname of a directory containing ``*.deb``
+                      archives (a string).
+    :returns: A tuple with two values:
+
+              1. A sorted list of :class:`deb_pkg_tools.package.PackageFile`
+                 objects (the result of
+                 :func:`~deb_pkg_tools.package.find_package_archives()`).
+              2. A dictionary that maps tuples with the name, version and
+                 architecture of each package archive to the corresponding
+                 :class:`~deb_pkg_tools.package.PackageFile` object.
+
+    The result is cached in :data:`REPOSITORY_CACHE` and the cache is
+    invalidated when the last modified time of the directory changes (which
+    happens when a file is added to, removed from or renamed within the
+    directory). This means repeated lookups cost a single :func:`os.stat()`
+    call instead of a directory scan. Nanosecond timestamps are used where
+    available (they aren't on Python 2.7).
+
+    File systems with coarse timestamps (one or two seconds) can't tell apart
+    changes made within the same "tick", so a scan of a directory that was
+    modified less than two seconds before the scan isn't trusted: The
+    directory is scanned again on the next call, until its last modified time
+    is old enough for the cached result to be reliable.
+
+    .. note:: Recent versions of :pypi:`deb-pkg-tools` report versions as
+              :class:`deb_pkg_tools.version.Version` objects, whose hash
+              values differ from those of the equivalent strings. That's
+              why versions are converted to plain strings for use as keys.
+    """
+    pathname = os.path.abspath(directory)
+    status = os.stat(pathname)
+    last_modified = getattr(status, 'st_mtime_ns', status.st_mtime)
+    cached_value = REPOSITORY_CACHE.get(pathname)
+    if cached_value and cached_value[0] == last_modified and cached_value[1] > status.st_mtime + 2:
+        return cached_value[2:]
+    scanned_at = time.time()
+    archives = find_package_archives(pathname)
+    index = {}
+    for archive in archives:
+        index.setdefault((archive.name, str(archive.version), archive.architecture), archive)
+    REPOSITORY_CACHE[pathname] = (last_modified, scanned_at, archives, index)
+    return archives, index
+
+
+def strip_object_files(object_files):
+    """
+    Use :man:`strip` to make object files smaller.
+
+    :param object_files: A list of strings with filenames of object files.
+
+    This function runs ``strip --strip-unneeded`` once for each batch of
+    object files (see :data:`STRIP_BATCH_SIZE`), instead of once per object
+    file like :func:`deb_pkg_tools.package.strip_object_files()` does.
+    Because :func:`~deb_pkg_tools.package.find_object_files()` can match
+    executables that aren't valid object files, :man:`strip` may fail. In that
+    case (or when the operating system refuses to run the command) the object
+    files in the batch are stripped one by one using
+    :func:`deb_pkg_tools.package.strip_object_files()`, which logs a warning
+    for each file that can't be stripped.
+    """
+    batches = [[]]
+    batch_size = 0
+    for filename in object_files:
+        if batches[-1] and batch_size + len(filename) > STRIP_BATCH_SIZE:
+            batches.append([])
+            batch_size = 0
+        batches[-1].append(filename)
+        batch_size += len(filename) + 1
+    for batch in batches:
+        if batch:
+            try:
+                execute('strip', '--strip-unneeded', *batch, logger=logger, silent=True)
+            except CommandNotFound:
+                logger.debug("Not stripping object files because 'strip' program isn't installed.")
+                return
+            except (ExternalCommandFailed, OSError):
+                logger.debug("Failed to strip object files in one go, falling back to stripping them one by one ..")
+                deb_pkg_tools.package.strip_object_files(batch)
 
 
 def tokenize_version(version_number):